@@ -1,58 +1,337 @@
-from quri_parts.circuit import QuantumCircuit
-from quri_parts.qulacs.simulator import run_circuit
+from quri_parts.circuit import QuantumCircuit, H, T, Tdag, X, CNOT
 from quri_parts.circuit.utils.circuit_drawer import draw_circuit
+from qulacs import QuantumState
+from qulacs import QuantumCircuit as QulacsCircuit
+from qulacs.circuit import QuantumCircuitOptimizer
 
 import numpy as np
 import random
 import re
 import exrex
 
+try:
+    import numba
+except ImportError:  # numba is optional and only needed for jit=True
+    numba = None
+
+# Optional numeric CNOT target offset following '@'/'C'
+_DIGITS = re.compile(r"\d+")
+
+
+def _njit(**options):
+    # numba.njit when numba is installed; otherwise leaves the function as is.
+    if numba is None:
+        return lambda func: func
+    return numba.njit(**options)
+
+
+_prange = range if numba is None else numba.prange
+
+# Instructions the jit interpreter runs before returning control to Python
+_JIT_CHUNK_STEPS = 1 << 16
+
+# Below this size thread start-up outweighs the gain from parallel kernels
+_PARALLEL_MIN_QUBITS = 18
+
+
+# Single-qubit gate matrices used to fuse runs of gates on the same qubit
+_H_MAT = np.array([[1, 1], [1, -1]], dtype=np.complex128) / np.sqrt(2)
+_T_MAT = np.diag([1, np.exp(0.25j * np.pi)])
+_TDAG_MAT = _T_MAT.conj()
+_X_MAT = np.array([[0, 1], [1, 0]], dtype=np.complex128)
+
+# Opcodes of the compiled interpreter; '[' and ':' do not touch the state there
+_NOP, _MOVE, _LOOP_END, _RANDOM, _RESET = 0, 1, 2, 3, 4
+_H, _T, _TDAG, _X, _CNOT, _RANDOM_GATE, _RANDOM_POINTER, _RANDOM_JUMP = 5, 6, 7, 8, 9, 10, 11, 12
+
+# Opcode of each preprocessed command
+_OPCODES = {
+    'MOVE': _MOVE, '[': _NOP, ']': _LOOP_END, ';': _RANDOM, ',': _RESET, ':': _NOP,
+    '+': _H, 'H': _H, '~': _T, 'T': _T, '-': _TDAG, 'D': _TDAG, 'x': _X, 'X': _X,
+    '@': _CNOT, 'C': _CNOT, '?': _RANDOM_GATE, '!': _RANDOM_POINTER, '*': _RANDOM_JUMP,
+}
+
+
+@_njit(cache=True)
+def _apply_1q(state, target, m00, m01, m10, m11):
+    # Applies a 2x2 matrix to the target qubit in place (bit-stride loop).
+    stride = 1 << target
+    for k in range(0, state.size, 2 * stride):
+        for l in range(stride):
+            i0 = k | l
+            i1 = i0 | stride
+            a = state[i0]
+            b = state[i1]
+            state[i0] = m00 * a + m01 * b
+            state[i1] = m10 * a + m11 * b
+
+
+@_njit(parallel=True, cache=True)
+def _apply_1q_parallel(state, target, m00, m01, m10, m11):
+    # Same as _apply_1q, with the 2^(n-1) amplitude pairs spread across threads
+    # so every target qubit splits into equal amounts of work.
+    stride = 1 << target
+    for idx in _prange(state.size >> 1):
+        # Insert a 0 bit at the target position to get the pair's lower index
+        i0 = ((idx >> target) << (target + 1)) | (idx & (stride - 1))
+        i1 = i0 | stride
+        a = state[i0]
+        b = state[i1]
+        state[i0] = m00 * a + m01 * b
+        state[i1] = m10 * a + m11 * b
+
+
+@_njit(cache=True)
+def _apply_gate(state, target, m00, m01, m10, m11, parallel):
+    # Applies a 2x2 matrix with the parallel kernel on large states.
+    if parallel:
+        _apply_1q_parallel(state, target, m00, m01, m10, m11)
+    else:
+        _apply_1q(state, target, m00, m01, m10, m11)
+
+
+@_njit(cache=True)
+def _apply_cnot(state, control, target):
+    # Applies CNOT in place by swapping amplitudes whose control bit is set.
+    cmask = 1 << control
+    tmask = 1 << target
+    for i in range(state.size):
+        if (i & cmask) and not (i & tmask):
+            j = i | tmask
+            a = state[i]
+            state[i] = state[j]
+            state[j] = a
+
+
+@_njit(cache=True)
+def _prob_one(state, target):
+    # Probability of measuring 1 on the target qubit.
+    mask = 1 << target
+    prob = 0.0
+    for i in range(state.size):
+        if i & mask:
+            a = state[i]
+            prob += a.real * a.real + a.imag * a.imag
+    return prob
+
+
+@_njit(cache=True)
+def _run_njit(ops, args, state, pointer, num_qubits, parallel, start, max_steps, seed):
+    # Runs a preprocessed program on the state in place, from instruction start
+    # for at most max_steps instructions.
+    # Returns the pointer, the next instruction index, and a trace of
+    # (instruction, pointer, detail) rows for every executed instruction;
+    # detail is 1 when '?' chose H.
+    # numba keeps its own RNG state, so it is seeded here from the caller
+    # (a negative seed continues the current stream).
+    if seed >= 0:
+        np.random.seed(seed)
+    h = 1.0 / np.sqrt(2.0)
+    t = np.exp(0.25j * np.pi)
+    trace = np.empty((max_steps, 3), np.int64)
+    n = 0
+    i = start
+    while i < ops.size and n < max_steps:
+        op = ops[i]
+        arg = args[i]
+        trace[n, 0] = i
+        trace[n, 1] = pointer
+        trace[n, 2] = 0
+        n += 1
+
+        if op == _MOVE:
+            pointer = (pointer + arg) % num_qubits
+        elif op == _LOOP_END:
+            # Repeat the loop when the estimated measurement is 1
+            if arg >= 0 and not np.random.random() > _prob_one(state, pointer):
+                i = arg
+                continue
+        elif op == _RANDOM:
+            norm = 0.0
+            for k in range(state.size):
+                re_part = np.random.standard_normal()
+                im_part = np.random.standard_normal()
+                state[k] = re_part + 1j * im_part
+                norm += re_part * re_part + im_part * im_part
+            scale = 1.0 / np.sqrt(norm)
+            for k in range(state.size):
+                state[k] = state[k] * scale
+        elif op == _RESET:
+            state[:] = 0
+            state[0] = 1
+        elif op == _H:
+            _apply_gate(state, pointer, h, h, h, -h, parallel)
+        elif op == _T:
+            _apply_gate(state, pointer, 1, 0, 0, t, parallel)
+        elif op == _TDAG:
+            _apply_gate(state, pointer, 1, 0, 0, t.conjugate(), parallel)
+        elif op == _X:
+            _apply_gate(state, pointer, 0, 1, 1, 0, parallel)
+        elif op == _CNOT:
+            target = (pointer + arg) % num_qubits
+            if target == pointer:
+                raise ValueError("CNOT control and target qubits must differ")
+            _apply_cnot(state, pointer, target)
+        elif op == _RANDOM_GATE:
+            if np.random.random() < 0.5:
+                trace[n - 1, 2] = 1
+                _apply_gate(state, pointer, h, h, h, -h, parallel)
+            else:
+                _apply_gate(state, pointer, 1, 0, 0, t, parallel)
+        elif op == _RANDOM_POINTER:
+            pointer = np.random.randint(0, num_qubits)
+        elif op == _RANDOM_JUMP:
+            i = np.random.randint(0, ops.size)
+            continue
+        # _NOP ('[' and ':') leaves the state untouched
+        i += 1
+    return pointer, i, trace[:n]
+
+
 class QF:
-    def __init__(self, num_qubits, regex=False, debug=True, init=None):
+    def __init__(self, num_qubits, regex=False, debug=True, init=None, record_history=True,
+                 dtype=None, jit=False, max_draw_gates=200, seed=None, max_steps=None):
         self.num_qubits = num_qubits
+        # Complex dtype of the state vector. qulacs simulates in complex128, so
+        # single precision only pays off with the jit interpreter.
+        if dtype is None:
+            dtype = np.complex64 if jit else np.complex128
+        self.cdtype = np.dtype(dtype)
 
         # Initialize quantum state
         if init is None:
             # Default to |0> state
-            self.state = np.zeros(2**num_qubits, dtype=complex)
+            self.state = np.zeros(2**num_qubits, dtype=self.cdtype)
             self.state[0] = 1.0
         elif isinstance(init, str):
             # Initialize based on binary string
-            state_vector = np.zeros(2**num_qubits, dtype=complex)
+            state_vector = np.zeros(2**num_qubits, dtype=self.cdtype)
             index = int(init, 2)
             state_vector[index] = 1.0
             self.state = state_vector
         else:
             # Initialize with a given state vector
-            self.state = np.array(init, dtype=complex)
+            self.state = np.array(init, dtype=self.cdtype)
 
+        # Random generators: without a seed these are the np.random and random
+        # modules themselves, so np.random.seed() and random.seed() keep working.
+        # self.rng draws Haar states, self._random '?', '!', '*' and estimate().
+        self.rng = np.random if seed is None else np.random.default_rng(seed)
+        self._random = random if seed is None else random.Random(seed)
         self.pointer = 0  # Pointer for qubit selection
         self.regex = regex  # Enable regex-based command expansion
         self.debug = debug  # Enable debugging messages
+        self.record_history = record_history  # Keep state snapshots in history
+        self.jit = jit  # Run programs with the numba-compiled interpreter
+        self.max_steps = max_steps  # Instruction budget per parse() with jit (None: unlimited)
+        if jit and numba is None:
+            raise ImportError("jit=True requires numba")
 
         # Quantum circuit tracking
-        self.circuit = QuantumCircuit(num_qubits)  # Current circuit
+        # Pending (not yet applied) gates, built directly as a qulacs circuit
+        self.circuit = QulacsCircuit(num_qubits)
         self.circuit_all = QuantumCircuit(num_qubits)  # Full circuit history
+        self._all_gates = []  # (gate factory, args) executed but not yet in circuit_all
+        self.max_draw_gates = max_draw_gates  # Largest circuit drawn in debug mode
+        self._pending_1q = {}  # Qubit -> fused 2x2 matrix not yet added to self.circuit
 
-        self.state_history = []  # History of quantum states
+        # Gate fusion and a scratch state reused across flushes. Both are created
+        # on the first flush, so the jit path never allocates the 2^n buffer.
+        self.optimizer = None
+        self.fusion_max_qubit = 2
+        self._scratch = None
+        self.update_count = 0  # Circuit update counter
+
+        # Per-qubit (upper bits, selected bit, lower bits) shapes used by estimate()
+        self._bit_shapes = [(2**(num_qubits - p - 1), 2, 2**p) for p in range(num_qubits)]
+
+        # Command dispatch table
+        self._dispatch = {
+            'MOVE': self._op_move,
+            '[': self._op_loop_start,
+            ']': self._op_loop_end,
+            ';': self._op_random,
+            ',': self._op_reset,
+            ':': self._op_estimate,
+            '+': self._op_h, 'H': self._op_h,
+            '~': self._op_t, 'T': self._op_t,
+            '-': self._op_tdag, 'D': self._op_tdag,
+            'x': self._op_x, 'X': self._op_x,
+            '@': self._op_cnot, 'C': self._op_cnot,
+            '?': self._op_random_gate,
+            '!': self._op_random_pointer,
+            '*': self._op_random_jump,
+        }
+        self.program = []  # Preprocessed instructions of the running code
+
+        # History of quantum states (or command indices if record_history is False).
+        # Every update rebinds self.state to a fresh array, so no copy is needed.
+        self.state_history = []
         self.command_history = []  # History of executed commands
-        self.state_history.append(self.state.copy())
+        self.save_history()
 
     def log(self, message):
         # Logs a message if debugging is enabled.
         if self.debug:
             print(message)
 
+    def flush(self):
+        # Applies the pending gates to the state as one fused circuit.
+        for qubit in list(self._pending_1q):
+            self.emit_1q(qubit)
+        if not self.circuit.get_gate_count():
+            return
+        if self._scratch is None:
+            self.optimizer = QuantumCircuitOptimizer()
+            self._scratch = QuantumState(self.num_qubits)
+        # Fuse consecutive gates into dense blocks of up to 2 qubits
+        self.optimizer.optimize(self.circuit, self.fusion_max_qubit)
+        # qulacs simulates in complex128; convert only at the boundary
+        self._scratch.load(self.state.astype(np.complex128, copy=False))
+        self.circuit.update_quantum_state(self._scratch)
+        self.state = self._scratch.get_vector().astype(self.cdtype, copy=False)
+        self.circuit = QulacsCircuit(self.num_qubits)
+        self.save_history()
+        self.update_count += 1
+
+    def discard(self):
+        # Drops the pending gates without applying them. Only valid right before
+        # the state is overwritten, since nothing can observe their effect.
+        self._pending_1q.clear()
+        if self.circuit.get_gate_count():
+            self.circuit = QulacsCircuit(self.num_qubits)
+
+    def stage_1q(self, matrix):
+        # Folds a single-qubit gate on the pointer into its pending matrix.
+        pending = self._pending_1q.get(self.pointer)
+        self._pending_1q[self.pointer] = matrix if pending is None else matrix @ pending
+
+    def emit_1q(self, qubit):
+        # Adds the pending matrix of a qubit to the circuit as one dense gate.
+        matrix = self._pending_1q.pop(qubit, None)
+        if matrix is not None:
+            self.circuit.add_dense_matrix_gate(qubit, matrix)
+
+    def save_history(self):
+        # Records the current state, or only its position in the command history.
+        if self.record_history:
+            self.state_history.append(self.state)
+        else:
+            self.state_history.append(len(self.command_history))
+
     def set_Haar_random_state(self):
         # Generates a Haar-random quantum state.
         dim = 2**self.num_qubits
-        state = np.random.randn(dim) + 1j * np.random.randn(dim)
-        state = state / np.linalg.norm(state)
+        # Draw real and imaginary parts in one call and reinterpret them as complex
+        real_dtype = np.finfo(self.cdtype).dtype
+        state = self.rng.standard_normal((dim, 2)).astype(real_dtype, copy=False)
+        state = state.view(self.cdtype).reshape(-1)
+        state /= np.linalg.norm(state)
         self.state = state
 
     def set_zero_state(self):
         # Resets the state to |0>.
-        self.state = np.zeros(2**self.num_qubits, dtype=complex)
+        self.state = np.zeros(2**self.num_qubits, dtype=self.cdtype)
         self.state[0] = 1.0
 
     def parse(self, code0):
@@ -65,104 +344,230 @@ class QF:
         else:
             code = code0
 
-        loop_stack = []  # Stack to handle loops
-        i = 0  # Command index
-        h = 0  # Circuit update counter
+        # Drop gates left behind by a previous parse() that raised partway through
+        self.discard()
+        self._all_gates = []
 
+        program = self.preprocess(code)
+        self.program = program
+        self.update_count = 0  # Circuit update counter
+        dispatch = self._dispatch
+        i = 0  # Instruction index
+
+        if self.jit:
+            self.run_jit(program)
+            i = len(program)
+
+        while i < len(program):
+            command, arg, text = program[i]
+            if self.debug:  # Skip formatting the message when it would be dropped
+                self.log(f"{(i, self.update_count)}: Command: {text}, Pointer: {self.pointer}")
+
+            # One history entry per source command: a fused MOVE expands back
+            # into its '>'/'<' characters and a CNOT drops its offset digits
+            if command == 'MOVE':
+                self.command_history.extend(text)
+            else:
+                self.command_history.append(command)
+            # Handlers return the next instruction index, or None to advance by one
+            next_i = dispatch[command](arg, i)
+            i = i + 1 if next_i is None else next_i
+
+        # Apply any gates still pending at the end of the code
+        self.flush()
+
+        self.log("Quantum Circuit Execution Completed")
+        # Materialize the executed gates into the full circuit in one pass
+        self.circuit_all.extend([gate(*args) for gate, args in self._all_gates])
+        self._all_gates = []
+        if self.debug:
+            if len(self.circuit_all.gates) <= self.max_draw_gates:
+                draw_circuit(self.circuit_all)  # Draw the final circuit
+            else:
+                self.log(f"Circuit has {len(self.circuit_all.gates)} gates, skipping drawing")
+        return self.state, self.state_history, self.command_history, self.circuit_all
+
+    def run_jit(self, program):
+        # Runs the program in the compiled interpreter, then rebuilds the command
+        # history and circuit from the execution trace. The interpreter runs in
+        # chunks of _JIT_CHUNK_STEPS instructions so Ctrl-C and max_steps can
+        # stop a program that never ends.
+        ops = np.array([_OPCODES[command] for command, _, _ in program], dtype=np.int64)
+        args = np.array([-1 if arg is None else arg for _, arg, _ in program], dtype=np.int64)
+        # Work on a copy so earlier state_history entries stay intact, and so a
+        # run that raises leaves the state and pointer as they were
+        state = self.state.copy()
+        pointer = self.pointer
+        parallel = self.num_qubits >= _PARALLEL_MIN_QUBITS
+        seed = int(self.rng.random() * 2**32)
+        steps = 0
+        i = 0
+        while i < len(program):
+            chunk = _JIT_CHUNK_STEPS
+            if self.max_steps is not None:
+                if steps >= self.max_steps:
+                    raise RuntimeError(f"Program did not finish within max_steps={self.max_steps}")
+                chunk = min(chunk, self.max_steps - steps)
+            pointer, i, trace = _run_njit(ops, args, state, pointer, self.num_qubits,
+                                          parallel, i, chunk, seed)
+            seed = -1
+            steps += len(trace)
+            self.record_trace(program, trace)
+        self.state = state
+        self.pointer = int(pointer)
+        self.save_history()
+        self.update_count += 1
+
+    def record_trace(self, program, trace):
+        # Appends the commands and gates of a jit execution trace to the histories.
+        for i, pointer, detail in trace.tolist():
+            command, arg, text = program[i]
+            if command == 'MOVE':
+                self.command_history.extend(text)
+            else:
+                self.command_history.append(command)
+            op = _OPCODES[command]
+            if op == _H or (op == _RANDOM_GATE and detail):
+                self._all_gates.append((H, (pointer,)))
+            elif op == _T or op == _RANDOM_GATE:
+                self._all_gates.append((T, (pointer,)))
+            elif op == _TDAG:
+                self._all_gates.append((Tdag, (pointer,)))
+            elif op == _X:
+                self._all_gates.append((X, (pointer,)))
+            elif op == _CNOT:
+                self._all_gates.append((CNOT, (pointer, (pointer + arg) % self.num_qubits)))
+
+    def preprocess(self, code):
+        # Translates code into a list of (command, argument, source text) instructions.
+        # Runs of '>'/'<' collapse into a single MOVE, CNOT offsets are parsed
+        # up front, matching brackets record each other's index, and invalid
+        # commands are dropped.
+        program = []
+        loop_stack = []  # Indices of unmatched '['
+        i = 0
         while i < len(code):
             command = code[i]
-            self.log(f"{(i, h)}: Command: {command}, Pointer: {self.pointer}")
-
-            if command == '>':
-                # Move pointer right
-                self.pointer = (self.pointer + 1) % self.num_qubits
-            elif command == '<':
-                # Move pointer left
-                self.pointer = (self.pointer - 1) % self.num_qubits
-            elif command == '[':
-                # Start loop
-                loop_stack.append(i)
-            elif command == ']':
-                # End loop; repeat if measurement result is nonzero
-                if not loop_stack:
-                    self.log("Error: Unmatched ']' found, skipping...")
-                elif self.estimate() == 0:
-                    loop_stack.pop()
-                else:
-                    i = loop_stack[-1]
-                    continue  # Jump back to loop start
-            elif command == ';':
-                # Set state to Haar-random
-                self.set_Haar_random_state()
-            elif command == ',':
-                # Reset to |0>
-                self.set_zero_state()
-            elif command == ':':
-                # Perform state estimation
-                self.estimate()
-            elif command in ['+', 'H']:
-                # Apply Hadamard gate
-                self.circuit.add_H_gate(self.pointer)
-            elif command in ['~', 'T']:
-                # Apply Tdag gate
-                self.circuit.add_T_gate(self.pointer)
-            elif command in ['-', 'D']:
-                # Apply X gate
-                self.circuit.add_Tdag_gate(self.pointer)
-            elif command in ['x', 'X']:
-                # Apply X gate
-                self.circuit.add_X_gate(self.pointer)
-            elif command in ['@', 'C']:
-                # Apply CNOT gate
-                match = re.match(r"\d+", code[i+1:])
-                if match:
-                    target_bit = (self.pointer + int(match.group(0))) % self.num_qubits
-                    i += len(match.group(0))
-                else:
-                    target_bit = (self.pointer + 1) % self.num_qubits
-                self.circuit.add_CNOT_gate(self.pointer, target_bit)
-            elif command == '?':
-                # Apply either H or T gate randomly
-                if random.choice([True, False]):
-                    self.circuit.add_H_gate(self.pointer)
-                else:
-                    self.circuit.add_T_gate(self.pointer)
-            elif command == '!':
-                # Set pointer to a random qubit
-                self.pointer = random.randint(0, self.num_qubits - 1)
-            elif command == '*':
-                # Jump to a random command index
-                i = random.randint(0, len(code) - 1)
+            if command in '><':
+                j = i
+                delta = 0
+                while j < len(code) and code[j] in '><':
+                    delta += 1 if code[j] == '>' else -1
+                    j += 1
+                program.append(('MOVE', delta, code[i:j]))
+                i = j
                 continue
-            else:
+            if command not in self._dispatch:
                 self.log(f"Invalid command: {command}, skipping...")
                 i += 1
                 continue
+            if command in '@C':
+                # CNOT target is the next qubit unless an offset follows
+                match = _DIGITS.match(code, i + 1)
+                j = match.end() if match else i + 1
+                offset = int(match.group(0)) if match else 1
+                program.append((command, offset, code[i:j]))
+                i = j
+                continue
+            if command == '[':
+                loop_stack.append(len(program))
+            elif command == ']' and loop_stack:
+                # Link the pair so loops need no runtime stack
+                start = loop_stack.pop()
+                program[start] = ('[', len(program), '[')
+                program.append((']', start, ']'))
+                i += 1
+                continue
+            program.append((command, None, command))
+            i += 1
+        return program
 
-            self.command_history.append(command)
+    def _op_move(self, delta, i):
+        # Move pointer by delta (fused run of '>' and '<')
+        self.pointer = (self.pointer + delta) % self.num_qubits
 
-            # If the command affects the state, update simulation
-            if command in ['+', 'H', '~', 'T', '-', 'D', 'x', 'X', '@', 'C', '?']:
-                result = run_circuit(self.circuit, self.state)
-                self.state = result
-                # Merge current circuit into full circuit history
-                self.circuit_all += self.circuit
-                # Reset current circuit
-                self.circuit = QuantumCircuit(self.num_qubits)
-                # Save state history
-                self.state_history.append(self.state)
-                h += 1
+    def _op_loop_start(self, end, i):
+        # Start loop (the matching ']' already knows where to jump back to)
+        pass
 
-            i += 1
+    def _op_loop_end(self, start, i):
+        # End loop; repeat if measurement result is nonzero
+        if start is None:
+            self.log("Error: Unmatched ']' found, skipping...")
+            return None
+        self.flush()
+        if self.estimate() == 0:
+            return None
+        return start  # Jump back to loop start
 
-        self.log("Quantum Circuit Execution Completed")
-        draw_circuit(self.circuit_all)  # Draw the final circuit
-        return self.state, self.state_history, self.command_history, self.circuit_all
+    def _op_random(self, arg, i):
+        # Set state to Haar-random; pending gates would be overwritten anyway
+        self.discard()
+        self.set_Haar_random_state()
+
+    def _op_reset(self, arg, i):
+        # Reset to |0>; pending gates would be overwritten anyway
+        self.discard()
+        self.set_zero_state()
+
+    def _op_estimate(self, arg, i):
+        # Perform state estimation
+        self.flush()
+        self.estimate()
+
+    def _op_h(self, arg, i):
+        # Apply Hadamard gate
+        self._all_gates.append((H, (self.pointer,)))
+        self.stage_1q(_H_MAT)
+
+    def _op_t(self, arg, i):
+        # Apply T gate
+        self._all_gates.append((T, (self.pointer,)))
+        self.stage_1q(_T_MAT)
+
+    def _op_tdag(self, arg, i):
+        # Apply Tdag gate
+        self._all_gates.append((Tdag, (self.pointer,)))
+        self.stage_1q(_TDAG_MAT)
+
+    def _op_x(self, arg, i):
+        # Apply X gate
+        self._all_gates.append((X, (self.pointer,)))
+        self.stage_1q(_X_MAT)
+
+    def _op_cnot(self, offset, i):
+        # Apply CNOT gate targeting the qubit offset from the pointer
+        target_bit = (self.pointer + offset) % self.num_qubits
+        if target_bit == self.pointer:
+            raise ValueError("CNOT control and target qubits must differ")
+        self._all_gates.append((CNOT, (self.pointer, target_bit)))
+        # Pending single-qubit gates on either qubit must come before the CNOT
+        self.emit_1q(self.pointer)
+        self.emit_1q(target_bit)
+        self.circuit.add_CNOT_gate(self.pointer, target_bit)
+
+    def _op_random_gate(self, arg, i):
+        # Apply either H or T gate randomly
+        if self._random.random() < 0.5:
+            self._op_h(arg, i)
+        else:
+            self._op_t(arg, i)
+
+    def _op_random_pointer(self, arg, i):
+        # Set pointer to a random qubit
+        self.pointer = int(self._random.random() * self.num_qubits)
+
+    def _op_random_jump(self, arg, i):
+        # Jump to a random instruction index
+        return int(self._random.random() * len(self.program))
 
     def estimate(self):
         # Estimates the probability of measuring 1 on the selected qubit.
-        dim = 2**self.num_qubits
-        prob = sum(np.abs(self.state[i])**2 for i in range(dim) if (i >> self.pointer) & 1)
-        result = 0 if random.random() > prob else 1
-        self.log(f"Measured qubit {self.pointer}: 1 with probability {prob}, result: {result}")
+        # View the state as (upper bits, selected bit, lower bits) to select bit = 1
+        view = self.state.reshape(self._bit_shapes[self.pointer])
+        ones = view[:, 1, :].ravel()
+        prob = float(np.vdot(ones, ones).real)
+        result = 0 if self._random.random() > prob else 1
+        if self.debug:
+            self.log(f"Measured qubit {self.pointer}: 1 with probability {prob}, result: {result}")
         return result